@@ -5,28 +5,62 @@ This module handles all Firestore operations
 
 import firebase_admin
 from firebase_admin import credentials, firestore
-from datetime import datetime
+from google.api_core import exceptions as gexc, retry
+from google.cloud.firestore_v1.base_query import FieldFilter
+from google.rpc import code_pb2
+from cachetools import TTLCache
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+import json
+import logging
 import os
+import threading
 from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # ================================================
 # FIREBASE INITIALIZATION
 # ================================================
 
-# Initialize Firebase Admin SDK
-# Make sure to set the FIREBASE_CREDENTIALS_PATH environment variable
-cred_path = os.getenv('FIREBASE_CREDENTIALS_PATH', 'firebase-credentials.json')
-
-if not os.path.exists(cred_path):
-    raise FileNotFoundError(f"Firebase credentials file not found at {cred_path}")
-
-cred = credentials.Certificate(cred_path)
-firebase_admin.initialize_app(cred)
-
-# Get Firestore database reference
-db = firestore.client()
+# Firebase is initialized lazily on first use so importing this module (and
+# forking server workers) doesn't pay for credential parsing and app setup.
+# Set GOOGLE_APPLICATION_CREDENTIALS_JSON (e.g. on Render) or point
+# FIREBASE_CREDENTIALS_PATH at a service account file
+_db = None
+_db_lock = threading.Lock()
+
+def _load_credentials():
+    """Build service account credentials from the environment"""
+    firebase_json = os.getenv('GOOGLE_APPLICATION_CREDENTIALS_JSON')
+    if firebase_json:
+        return credentials.Certificate(json.loads(firebase_json))
+
+    cred_path = os.getenv('FIREBASE_CREDENTIALS_PATH', 'firebase-credentials.json')
+    if not os.path.exists(cred_path):
+        raise FileNotFoundError(f"Firebase credentials file not found at {cred_path}")
+    return credentials.Certificate(cred_path)
+
+def get_db():
+    """Get the shared Firestore client, initializing Firebase on first call"""
+    global _db
+    if _db is None:
+        with _db_lock:
+            if _db is None:
+                if not firebase_admin._apps:
+                    firebase_admin.initialize_app(_load_credentials())
+                # This is the single shared client for the whole app
+                _db = firestore.client()
+    return _db
+
+def warm_up() -> None:
+    """Open the gRPC channel with a tiny read so the first request is fast"""
+    try:
+        get_db().collection(USERS_COLLECTION).limit(1).get(retry=READ_RETRY)
+    except gexc.GoogleAPIError:
+        logger.exception("Error warming up Firestore")
 
 # ================================================
 # COLLECTIONS
@@ -35,122 +69,403 @@ db = firestore.client()
 USERS_COLLECTION = 'users'
 ORDERS_COLLECTION = 'orders'
 
+# Bulk writes that fail with these codes were not applied, so retrying them
+# can't double-count an Increment; anything else (e.g. NOT_FOUND) is final
+RETRYABLE_WRITE_CODES = {
+    code_pb2.ABORTED,
+    code_pb2.UNAVAILABLE,
+    code_pb2.RESOURCE_EXHAUSTED,
+}
+MAX_WRITE_ATTEMPTS = 5
+
+# Concurrent per-user writes for bulk operations that can't be batched;
+# gains flatten out beyond ~40 threads on one channel
+MAX_BULK_WORKERS = 40
+
+# Exponential backoff for reads on transient gRPC errors. Writes keep the
+# SDK's default policy so non-idempotent updates (Increment) are never replayed.
+READ_RETRY = retry.Retry(
+    predicate=retry.if_exception_type(
+        gexc.ServiceUnavailable,
+        gexc.DeadlineExceeded,
+        gexc.Aborted,
+    ),
+    initial=0.1,
+    maximum=2.0,
+    multiplier=2.0,
+    timeout=10.0,
+)
+
+# ================================================
+# READ CACHE
+# ================================================
+
+# Short-lived in-process caches so repeated reads of the same user or order
+# list hit Firestore at most once per TTL window. Writes invalidate entries.
+USER_CACHE_TTL = 30
+ORDERS_CACHE_TTL = 10
+
+_cache_lock = threading.RLock()
+_user_cache = TTLCache(maxsize=10_000, ttl=USER_CACHE_TTL)
+_orders_cache = TTLCache(maxsize=16, ttl=ORDERS_CACHE_TTL)
+
+# Invalidation counters. A reader records the counter before fetching and
+# only stores its result if no write invalidated the entry in the meantime,
+# so a slow read can't put a pre-write document back into the cache.
+_user_versions = {}
+_orders_version = 0
+
+def _invalidate_user(*uids: str) -> None:
+    """Drop cached user documents after a write"""
+    with _cache_lock:
+        for uid in uids:
+            _user_cache.pop(uid, None)
+            _user_versions[uid] = _user_versions.get(uid, 0) + 1
+
+def _invalidate_orders() -> None:
+    """Drop cached order lists after a write"""
+    global _orders_version
+    with _cache_lock:
+        _orders_cache.clear()
+        _orders_version += 1
+
+# ================================================
+# ORDERS LIVE VIEW
+# ================================================
+
+# In-memory copy of the orders collection kept current by a snapshot listener.
+# Once the first snapshot has arrived, order listing and stats are served from
+# RAM with no Firestore reads. Very large batch writes can delay the listener,
+# so the view may briefly lag behind Firestore. If the watch stream dies, the
+# view is dropped and readers fall back to Firestore until a new listener has
+# delivered its first snapshot.
+# The view has its own locks so a large snapshot never blocks user-cache reads.
+# _orders_view_lock guards the view itself and is the only lock the listener
+# callback takes; _orders_listener_lock serializes subscribe/unsubscribe.
+_orders_view_lock = threading.Lock()
+_orders_listener_lock = threading.Lock()
+_orders_view = {}
+_orders_view_ready = threading.Event()
+_orders_watch = None
+_orders_watch_generation = 0
+
+def _on_orders_snapshot(generation: int, col_snapshot, changes, read_time) -> None:
+    """Apply listener changes to the in-memory orders view"""
+    with _orders_view_lock:
+        if generation != _orders_watch_generation:
+            # Late event from a watch that has since been stopped or replaced
+            return
+        for change in changes:
+            order_id = change.document.id
+            if change.type.name == 'REMOVED':
+                _orders_view.pop(order_id, None)
+            else:
+                order_data = change.document.to_dict()
+                order_data['id'] = order_id
+                _orders_view[order_id] = order_data
+        _orders_view_ready.set()
+
+def _detach_orders_watch():
+    """Forget the current watch and drop the view (hold _orders_listener_lock)"""
+    global _orders_watch, _orders_watch_generation
+    watch, _orders_watch = _orders_watch, None
+    with _orders_view_lock:
+        _orders_watch_generation += 1
+        _orders_view.clear()
+        _orders_view_ready.clear()
+    return watch
+
+def start_orders_listener() -> None:
+    """Subscribe to the orders collection (idempotent)"""
+    global _orders_watch
+    with _orders_listener_lock:
+        if _orders_watch is not None:
+            return
+        with _orders_view_lock:
+            generation = _orders_watch_generation
+        callback = partial(_on_orders_snapshot, generation)
+        _orders_watch = get_db().collection(ORDERS_COLLECTION).on_snapshot(callback)
+
+def _orders_view_live() -> bool:
+    """Whether the orders view is current and safe to serve from"""
+    if not _orders_view_ready.is_set():
+        return False
+
+    with _orders_listener_lock:
+        if _orders_watch is None:
+            return False
+        if _orders_watch.is_active:
+            return True
+
+        # The watch closed after an unrecoverable error; don't serve a frozen view
+        logger.error("Orders listener stopped, falling back to Firestore reads")
+        _detach_orders_watch()
+
+    try:
+        start_orders_listener()
+    except gexc.GoogleAPIError:
+        logger.exception("Error restarting orders listener")
+    return False
+
+def stop_orders_listener() -> None:
+    """Unsubscribe from the orders collection and drop the view"""
+    with _orders_listener_lock:
+        watch = _detach_orders_watch()
+    # Outside the locks: unsubscribe joins the watch thread, which may be
+    # waiting on _orders_view_lock to deliver a (now ignored) event
+    if watch is not None:
+        watch.unsubscribe()
+
+def _orders_from_view(status: str = None) -> list:
+    """Orders from the live view, newest first"""
+    with _orders_view_lock:
+        orders = [
+            dict(order) for order in _orders_view.values()
+            if not status or order.get('status') == status
+        ]
+    # Orders without created_at sort last instead of breaking the comparison
+    orders.sort(
+        key=lambda o: (o.get('created_at') is not None, o.get('created_at')),
+        reverse=True
+    )
+    return orders
+
+# ================================================
+# ERRORS
+# ================================================
+
+class OperationError(Exception):
+    """A request rejected by business rules (e.g. insufficient balance)"""
+
+class NotFoundError(OperationError):
+    """The user or order the request refers to does not exist"""
+
+class AlreadyExistsError(OperationError):
+    """The document being created already exists"""
+
 # ================================================
 # USER OPERATIONS
 # ================================================
 
 def create_user(uid: str, email: str) -> bool:
-    """Create a new user document"""
+    """Create a new user document (raises AlreadyExistsError if it exists)"""
     try:
-        user_ref = db.collection(USERS_COLLECTION).document(uid)
-        user_ref.set({
+        # create() never overwrites, so an existing user keeps balance and username
+        user_ref = get_db().collection(USERS_COLLECTION).document(uid)
+        user_ref.create({
+            'uid': uid,
             'email': email,
             'username': None,
             'balance': 0,
-            'created_at': datetime.now(),
-            'updated_at': datetime.now()
+            'created_at': firestore.SERVER_TIMESTAMP,
+            'updated_at': firestore.SERVER_TIMESTAMP
         })
+        _invalidate_user(uid)
         return True
-    except Exception as e:
-        print(f"Error creating user: {e}")
+    except gexc.AlreadyExists:
+        raise AlreadyExistsError("User already exists")
+    except gexc.GoogleAPIError:
+        logger.exception("Error creating user")
         return False
 
 def get_user(uid: str) -> dict:
-    """Get user data by UID"""
+    """Get user data by UID; None only if the user does not exist"""
     try:
-        user_ref = db.collection(USERS_COLLECTION).document(uid)
-        user_doc = user_ref.get()
+        with _cache_lock:
+            cached = _user_cache.get(uid)
+            version = _user_versions.get(uid, 0)
+        if cached is not None:
+            return dict(cached)
+
+        user_ref = get_db().collection(USERS_COLLECTION).document(uid)
+        user_doc = user_ref.get(retry=READ_RETRY)
         if user_doc.exists:
-            return user_doc.to_dict()
-        return None
-    except Exception as e:
-        print(f"Error getting user: {e}")
+            user_data = user_doc.to_dict()
+            with _cache_lock:
+                if _user_versions.get(uid, 0) == version:
+                    _user_cache[uid] = user_data
+            return dict(user_data)
         return None
+    except gexc.GoogleAPIError:
+        logger.exception("Error getting user")
+        raise
+
+def get_user_field(uid: str, field: str, default=None):
+    """Get a single field of a user document"""
+    try:
+        with _cache_lock:
+            cached = _user_cache.get(uid)
+        if cached is not None:
+            return cached.get(field, default)
+
+        # Field mask: Firestore returns only the requested field
+        user_ref = get_db().collection(USERS_COLLECTION).document(uid)
+        user_doc = user_ref.get(field_paths=[field], retry=READ_RETRY)
+        if user_doc.exists:
+            return user_doc.to_dict().get(field, default)
+        return default
+    except gexc.GoogleAPIError:
+        logger.exception("Error getting user field")
+        return default
+
+@firestore.transactional
+def _set_username_tx(transaction, user_ref, username: str) -> None:
+    """Set the username inside a transaction if it isn't set yet"""
+    # Read live, not from the cache: another worker may have set it already
+    snapshot = user_ref.get(field_paths=['username'], transaction=transaction)
+    if not snapshot.exists:
+        raise NotFoundError("User not found")
+
+    if snapshot.to_dict().get('username'):
+        raise OperationError("Username already set. Cannot change.")
+
+    transaction.update(user_ref, {
+        'username': username,
+        'updated_at': firestore.SERVER_TIMESTAMP
+    })
 
 def set_user_username(uid: str, username: str) -> bool:
-    """Set username for user (one-time only)"""
+    """Set username for user (one-time only, raises OperationError if already set)"""
     try:
-        user = get_user(uid)
-        if not user:
-            raise ValueError("User not found")
-        
-        if user.get('username'):
-            raise ValueError("Username already set. Cannot change.")
-        
-        user_ref = db.collection(USERS_COLLECTION).document(uid)
-        user_ref.update({
-            'username': username,
-            'updated_at': datetime.now()
-        })
+        user_ref = get_db().collection(USERS_COLLECTION).document(uid)
+        _set_username_tx(get_db().transaction(), user_ref, username)
+        _invalidate_user(uid)
         return True
-    except Exception as e:
-        print(f"Error setting username: {e}")
+    except gexc.GoogleAPIError:
+        logger.exception("Error setting username")
         return False
 
 def get_user_balance(uid: str) -> float:
     """Get user balance"""
-    try:
-        user = get_user(uid)
-        if user:
-            return user.get('balance', 0)
-        return 0
-    except Exception as e:
-        print(f"Error getting balance: {e}")
-        return 0
+    return get_user_field(uid, 'balance', 0)
 
 def update_user_balance(uid: str, data: dict) -> bool:
     """Update any user field"""
     try:
-        user_ref = db.collection(USERS_COLLECTION).document(uid)
-        data['updated_at'] = datetime.now()
+        user_ref = get_db().collection(USERS_COLLECTION).document(uid)
+        data['updated_at'] = firestore.SERVER_TIMESTAMP
         user_ref.update(data)
+        _invalidate_user(uid)
         return True
-    except Exception as e:
-        print(f"Error updating user: {e}")
+    except gexc.GoogleAPIError:
+        logger.exception("Error updating user")
         return False
 
 def set_balance(uid: str, amount: float) -> bool:
     """Set balance to specific amount"""
-    try:
-        return update_user_balance(uid, {'balance': amount})
-    except Exception as e:
-        print(f"Error setting balance: {e}")
-        return False
+    return update_user_balance(uid, {'balance': amount})
 
 def add_balance_to_user(uid: str, amount: float) -> bool:
     """Add amount to user balance"""
     try:
-        current_balance = get_user_balance(uid)
-        new_balance = current_balance + amount
-        return set_balance(uid, new_balance)
-    except Exception as e:
-        print(f"Error adding balance: {e}")
+        # Server-side increment: one write, no read, no lost updates
+        user_ref = get_db().collection(USERS_COLLECTION).document(uid)
+        user_ref.update({
+            'balance': firestore.Increment(amount),
+            'updated_at': firestore.SERVER_TIMESTAMP
+        })
+        _invalidate_user(uid)
+        return True
+    except gexc.GoogleAPIError:
+        logger.exception("Error adding balance")
         return False
 
+@firestore.transactional
+def _deduct_balance_tx(transaction, user_ref, amount: float) -> float:
+    """Deduct amount inside a transaction, checking the balance first"""
+    snapshot = user_ref.get(transaction=transaction)
+    if not snapshot.exists:
+        raise NotFoundError("User not found")
+
+    current_balance = snapshot.to_dict().get('balance', 0) or 0
+    if current_balance < amount:
+        raise OperationError("Insufficient balance")
+
+    new_balance = current_balance - amount
+    transaction.update(user_ref, {
+        'balance': new_balance,
+        'updated_at': firestore.SERVER_TIMESTAMP
+    })
+    return new_balance
+
 def deduct_user_balance(uid: str, amount: float) -> bool:
-    """Deduct amount from user balance"""
+    """Deduct amount from user balance (raises OperationError if insufficient)"""
     try:
-        current_balance = get_user_balance(uid)
-        if current_balance < amount:
-            raise ValueError("Insufficient balance")
-        new_balance = current_balance - amount
-        return set_balance(uid, new_balance)
-    except Exception as e:
-        print(f"Error deducting balance: {e}")
+        user_ref = get_db().collection(USERS_COLLECTION).document(uid)
+        _deduct_balance_tx(get_db().transaction(), user_ref, amount)
+        _invalidate_user(uid)
+        return True
+    except gexc.GoogleAPIError:
+        logger.exception("Error deducting balance")
         return False
 
+@firestore.transactional
+def _apply_balance_tx(transaction, user_ref, action: str, amount: float) -> float:
+    """Add, deduct or set the balance inside a transaction"""
+    snapshot = user_ref.get(transaction=transaction)
+    if not snapshot.exists:
+        raise NotFoundError("User not found")
+
+    balance = snapshot.to_dict().get('balance', 0) or 0
+
+    if action == 'add':
+        balance += amount
+    elif action == 'deduct':
+        if balance < amount:
+            raise OperationError("Insufficient balance")
+        balance -= amount
+    elif action == 'set':
+        balance = amount
+    else:
+        raise OperationError("Invalid action")
+
+    transaction.update(user_ref, {
+        'balance': balance,
+        'updated_at': firestore.SERVER_TIMESTAMP
+    })
+    return balance
+
+def apply_balance_action(uid: str, action: str, amount: float) -> float:
+    """Add, deduct or set user balance and return the new balance"""
+    try:
+        user_ref = get_db().collection(USERS_COLLECTION).document(uid)
+        balance = _apply_balance_tx(get_db().transaction(), user_ref, action, amount)
+        _invalidate_user(uid)
+        return balance
+    except gexc.GoogleAPIError:
+        logger.exception("Error applying balance action")
+        raise
+
+def iter_users(page_size: int = 500, fields: list = None):
+    """Yield user documents page by page, optionally projected to fields"""
+    query = get_db().collection(USERS_COLLECTION)\
+              .order_by(firestore.FieldPath.document_id())\
+              .limit(page_size)
+    if fields:
+        query = query.select(fields)
+
+    last_doc = None
+    while True:
+        page_query = query.start_after(last_doc) if last_doc else query
+        docs = list(page_query.stream(retry=READ_RETRY))
+        if not docs:
+            break
+        yield from docs
+        if len(docs) < page_size:
+            break
+        last_doc = docs[-1]
+
 def get_all_users() -> list:
     """Get all users"""
     try:
         users = []
-        docs = db.collection(USERS_COLLECTION).stream()
-        for doc in docs:
+        for doc in iter_users():
             user_data = doc.to_dict()
             user_data['uid'] = doc.id
             users.append(user_data)
         return users
-    except Exception as e:
-        print(f"Error getting all users: {e}")
+    except gexc.GoogleAPIError:
+        logger.exception("Error getting all users")
         return []
 
 # ================================================
@@ -160,87 +475,160 @@ def get_all_users() -> list:
 def save_order(order_data: dict) -> str:
     """Save a new order and return order ID"""
     try:
-        order_data['created_at'] = datetime.now()
-        order_data['updated_at'] = datetime.now()
+        order_data['created_at'] = firestore.SERVER_TIMESTAMP
+        order_data['updated_at'] = firestore.SERVER_TIMESTAMP
         
         # Add document to orders collection
-        doc_ref = db.collection(ORDERS_COLLECTION).add(order_data)
+        doc_ref = get_db().collection(ORDERS_COLLECTION).add(order_data)
         order_id = doc_ref[1].id
+        _invalidate_orders()
         
         return order_id
-    except Exception as e:
-        print(f"Error saving order: {e}")
+    except gexc.GoogleAPIError:
+        logger.exception("Error saving order")
+        raise
+
+@firestore.transactional
+def _place_order_tx(transaction, user_ref, order_ref, order_data: dict) -> None:
+    """Check balance, deduct it and create the order in one commit"""
+    snapshot = user_ref.get(field_paths=['balance'], transaction=transaction)
+    if not snapshot.exists:
+        raise NotFoundError("User not found")
+
+    balance = snapshot.to_dict().get('balance', 0) or 0
+    if balance < order_data['amount']:
+        raise OperationError("Insufficient balance")
+
+    transaction.update(user_ref, {
+        'balance': firestore.Increment(-order_data['amount']),
+        'updated_at': firestore.SERVER_TIMESTAMP
+    })
+    transaction.set(order_ref, order_data)
+
+def place_order(order_data: dict) -> str:
+    """Charge the user and save a new order atomically, return order ID"""
+    try:
+        # ID is generated client-side, so no extra round-trip is needed to learn it
+        order_ref = get_db().collection(ORDERS_COLLECTION).document()
+        user_ref = get_db().collection(USERS_COLLECTION).document(order_data['uid'])
+
+        order_data['order_id'] = order_ref.id
+        order_data['created_at'] = firestore.SERVER_TIMESTAMP
+        order_data['updated_at'] = firestore.SERVER_TIMESTAMP
+
+        _place_order_tx(get_db().transaction(), user_ref, order_ref, order_data)
+        _invalidate_user(order_data['uid'])
+        _invalidate_orders()
+        return order_ref.id
+    except gexc.GoogleAPIError:
+        logger.exception("Error placing order")
         raise
 
 def get_order(order_id: str) -> dict:
     """Get order by ID"""
     try:
-        order_ref = db.collection(ORDERS_COLLECTION).document(order_id)
-        order_doc = order_ref.get()
+        order_ref = get_db().collection(ORDERS_COLLECTION).document(order_id)
+        order_doc = order_ref.get(retry=READ_RETRY)
         if order_doc.exists:
             order_data = order_doc.to_dict()
             order_data['id'] = order_id
             return order_data
         return None
-    except Exception as e:
-        print(f"Error getting order: {e}")
+    except gexc.GoogleAPIError:
+        logger.exception("Error getting order")
         return None
 
-def get_user_orders(uid: str) -> list:
-    """Get all orders for a specific user"""
+def get_orders_page(uid: str = None, status: str = None,
+                    limit: int = 50, cursor: str = None) -> tuple:
+    """Get one page of orders, newest first, as (orders, next_cursor)"""
     try:
+        # Served by the (uid, created_at) and (status, created_at) composite
+        # indexes in firestore.indexes.json
+        query = get_db().collection(ORDERS_COLLECTION)
+        if uid:
+            query = query.where(filter=FieldFilter('uid', '==', uid))
+        if status:
+            query = query.where(filter=FieldFilter('status', '==', status))
+        query = query.order_by('created_at', direction=firestore.Query.DESCENDING)\
+                     .limit(limit)
+
+        if cursor:
+            # cursor is the id of the last order of the previous page; a "/"
+            # would make document() address a nested path instead
+            if '/' in cursor:
+                raise OperationError("Invalid cursor")
+            cursor_doc = get_db().collection(ORDERS_COLLECTION).document(cursor).get(retry=READ_RETRY)
+            if not cursor_doc.exists:
+                raise OperationError("Invalid cursor")
+            query = query.start_after(cursor_doc)
+
         orders = []
-        docs = db.collection(ORDERS_COLLECTION)\
-               .where('uid', '==', uid)\
-               .order_by('created_at', direction=firestore.Query.DESCENDING)\
-               .stream()
-        
-        for doc in docs:
+        for doc in query.stream(retry=READ_RETRY):
             order_data = doc.to_dict()
             order_data['id'] = doc.id
             orders.append(order_data)
-        
-        return orders
-    except Exception as e:
-        print(f"Error getting user orders: {e}")
-        return []
+
+        next_cursor = orders[-1]['id'] if len(orders) == limit else None
+        return orders, next_cursor
+    except gexc.GoogleAPIError:
+        logger.exception("Error getting orders page")
+        raise
+
+def get_user_orders(uid: str, limit: int = 50, cursor: str = None) -> tuple:
+    """Get a page of orders for a specific user as (orders, next_cursor)"""
+    return get_orders_page(uid=uid, limit=limit, cursor=cursor)
 
 def get_all_orders(status: str = None) -> list:
     """Get all orders, optionally filtered by status"""
+    if _orders_view_live():
+        return _orders_from_view(status)
+
     try:
+        with _cache_lock:
+            cached = _orders_cache.get(status)
+            version = _orders_version
+        if cached is not None:
+            return list(cached)
+
         orders = []
         
         if status:
-            docs = db.collection(ORDERS_COLLECTION)\
-                   .where('status', '==', status)\
+            docs = get_db().collection(ORDERS_COLLECTION)\
+                   .where(filter=FieldFilter('status', '==', status))\
                    .order_by('created_at', direction=firestore.Query.DESCENDING)\
-                   .stream()
+                   .stream(retry=READ_RETRY)
         else:
-            docs = db.collection(ORDERS_COLLECTION)\
+            docs = get_db().collection(ORDERS_COLLECTION)\
                    .order_by('created_at', direction=firestore.Query.DESCENDING)\
-                   .stream()
+                   .stream(retry=READ_RETRY)
         
         for doc in docs:
             order_data = doc.to_dict()
             order_data['id'] = doc.id
             orders.append(order_data)
         
-        return orders
-    except Exception as e:
-        print(f"Error getting all orders: {e}")
+        with _cache_lock:
+            if _orders_version == version:
+                _orders_cache[status] = orders
+        return list(orders)
+    except gexc.GoogleAPIError:
+        logger.exception("Error getting all orders")
         return []
 
 def update_order_status(order_id: str, status: str) -> bool:
-    """Update order status"""
+    """Update order status (raises NotFoundError if the order doesn't exist)"""
     try:
-        order_ref = db.collection(ORDERS_COLLECTION).document(order_id)
+        order_ref = get_db().collection(ORDERS_COLLECTION).document(order_id)
         order_ref.update({
             'status': status,
-            'updated_at': datetime.now()
+            'updated_at': firestore.SERVER_TIMESTAMP
         })
+        _invalidate_orders()
         return True
-    except Exception as e:
-        print(f"Error updating order: {e}")
+    except gexc.NotFound:
+        raise NotFoundError("Order not found")
+    except gexc.GoogleAPIError:
+        logger.exception("Error updating order")
         return False
 
 def get_pending_orders() -> list:
@@ -255,65 +643,222 @@ def get_completed_orders() -> list:
 # STATISTICS
 # ================================================
 
+# sum() aggregations need a recent google-cloud-firestore; older SDKs only
+# have count(), so check once instead of catching AttributeError per call
+SUPPORTS_SUM_AGGREGATION = hasattr(firestore.CollectionReference, 'sum')
+
+def _run_aggregation(aggregation_query) -> dict:
+    """Run a server-side aggregation query and map alias -> value"""
+    results = {}
+    for result_set in aggregation_query.get(retry=READ_RETRY):
+        for result in result_set:
+            results[result.alias] = result.value
+    return results
+
+def _summarize_orders(orders) -> dict:
+    """Order statistics computed in a single pass over an iterable of orders"""
+    total = pending = completed = 0
+    revenue = 0
+    for order in orders:
+        total += 1
+        revenue += order.get('amount', 0) or 0
+        status = order.get('status')
+        if status == 'pending':
+            pending += 1
+        elif status == 'completed':
+            completed += 1
+
+    return {
+        'total_orders': total,
+        'pending_orders': pending,
+        'completed_orders': completed,
+        'total_revenue': revenue
+    }
+
+def _stream_order_stats(orders_ref) -> dict:
+    """Order statistics without aggregations: stream two fields, count in one pass"""
+    docs = orders_ref.select(['status', 'amount']).stream(retry=READ_RETRY)
+    return _summarize_orders(doc.to_dict() for doc in docs)
+
 def get_order_stats() -> dict:
     """Get order statistics"""
+    if _orders_view_live():
+        # Take a shallow snapshot so the listener isn't blocked while counting
+        with _orders_view_lock:
+            orders = list(_orders_view.values())
+        return _summarize_orders(orders)
+
     try:
-        all_orders = get_all_orders()
-        pending = [o for o in all_orders if o.get('status') == 'pending']
-        completed = [o for o in all_orders if o.get('status') == 'completed']
-        
-        total_revenue = sum(o.get('amount', 0) for o in all_orders)
-        
+        orders_ref = get_db().collection(ORDERS_COLLECTION)
+
+        if not SUPPORTS_SUM_AGGREGATION:
+            return _stream_order_stats(orders_ref)
+
+        # Aggregations are computed by Firestore; no order documents are downloaded.
+        # The three queries are independent, so run them concurrently.
+        try:
+            with ThreadPoolExecutor(max_workers=3) as executor:
+                totals, pending, completed = executor.map(_run_aggregation, [
+                    orders_ref.count(alias='total_orders').sum('amount', alias='total_revenue'),
+                    orders_ref.where(filter=FieldFilter('status', '==', 'pending')).count(alias='count'),
+                    orders_ref.where(filter=FieldFilter('status', '==', 'completed')).count(alias='count')
+                ])
+        except gexc.MethodNotImplemented:
+            # Emulator without aggregation support
+            return _stream_order_stats(orders_ref)
+
         return {
-            'total_orders': len(all_orders),
-            'pending_orders': len(pending),
-            'completed_orders': len(completed),
-            'total_revenue': total_revenue
+            'total_orders': totals.get('total_orders', 0),
+            'pending_orders': pending.get('count', 0),
+            'completed_orders': completed.get('count', 0),
+            'total_revenue': totals.get('total_revenue', 0)
         }
-    except Exception as e:
-        print(f"Error getting order stats: {e}")
-        return {}
+    except gexc.GoogleAPIError:
+        logger.exception("Error getting order stats")
+        raise
+
+def _stream_user_stats() -> dict:
+    """User statistics without aggregations: page through balances only"""
+    total_users = total_balance = 0
+    for doc in iter_users(fields=['balance']):
+        total_users += 1
+        total_balance += doc.to_dict().get('balance', 0) or 0
+    return {'total_users': total_users, 'total_balance': total_balance}
 
 def get_user_stats() -> dict:
     """Get user statistics"""
     try:
-        all_users = get_all_users()
-        total_balance = sum(u.get('balance', 0) for u in all_users)
-        
+        if not SUPPORTS_SUM_AGGREGATION:
+            return _stream_user_stats()
+
+        try:
+            totals = _run_aggregation(
+                get_db().collection(USERS_COLLECTION)
+                  .count(alias='total_users')
+                  .sum('balance', alias='total_balance')
+            )
+        except gexc.MethodNotImplemented:
+            # Emulator without aggregation support
+            return _stream_user_stats()
+
         return {
-            'total_users': len(all_users),
-            'total_balance': total_balance
+            'total_users': totals.get('total_users', 0),
+            'total_balance': totals.get('total_balance', 0)
+        }
+    except gexc.GoogleAPIError:
+        logger.exception("Error getting user stats")
+        raise
+
+def get_all_stats() -> dict:
+    """Get order and user statistics together"""
+    # Both sets of aggregations run in parallel, so latency is the slower of the two
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        order_stats = executor.submit(get_order_stats)
+        user_stats = executor.submit(get_user_stats)
+        return {
+            'orders': order_stats.result(),
+            'users': user_stats.result()
         }
-    except Exception as e:
-        print(f"Error getting user stats: {e}")
-        return {}
 
 # ================================================
 # BATCH OPERATIONS
 # ================================================
 
+@firestore.transactional
+def _transfer_balance_tx(transaction, from_ref, to_ref, amount: float) -> None:
+    """Move balance between two users in a single transaction"""
+    # All reads must happen before any write inside a transaction
+    from_snapshot = from_ref.get(transaction=transaction)
+    to_snapshot = to_ref.get(transaction=transaction)
+    if not from_snapshot.exists or not to_snapshot.exists:
+        raise NotFoundError("User not found")
+
+    from_balance = from_snapshot.to_dict().get('balance', 0) or 0
+    if from_balance < amount:
+        raise OperationError("Insufficient balance")
+
+    transaction.update(from_ref, {
+        'balance': from_balance - amount,
+        'updated_at': firestore.SERVER_TIMESTAMP
+    })
+    transaction.update(to_ref, {
+        'balance': firestore.Increment(amount),
+        'updated_at': firestore.SERVER_TIMESTAMP
+    })
+
 def transfer_balance(from_uid: str, to_uid: str, amount: float) -> bool:
-    """Transfer balance from one user to another"""
+    """Transfer balance between users (raises OperationError if insufficient)"""
     try:
-        if deduct_user_balance(from_uid, amount):
-            if add_balance_to_user(to_uid, amount):
-                return True
-        return False
-    except Exception as e:
-        print(f"Error transferring balance: {e}")
+        from_ref = get_db().collection(USERS_COLLECTION).document(from_uid)
+        to_ref = get_db().collection(USERS_COLLECTION).document(to_uid)
+        _transfer_balance_tx(get_db().transaction(), from_ref, to_ref, amount)
+        _invalidate_user(from_uid, to_uid)
+        return True
+    except gexc.GoogleAPIError:
+        logger.exception("Error transferring balance")
         return False
 
 def bulk_add_balance(uid_list: list, amount: float) -> dict:
     """Add balance to multiple users"""
+    # BulkWriter batches the updates but reports each write separately,
+    # so one missing uid only fails that uid
+    results = {uid: False for uid in uid_list}
+
+    def on_result(reference, write_result, bulk_writer):
+        results[reference.id] = True
+
+    def on_error(failure, bulk_writer) -> bool:
+        if failure.code in RETRYABLE_WRITE_CODES and failure.attempts < MAX_WRITE_ATTEMPTS:
+            return True
+        logger.error(
+            "Error bulk adding balance for %s: %s",
+            failure.operation.reference.id, failure.message
+        )
+        return False
+
     try:
-        results = {}
+        bulk_writer = get_db().bulk_writer()
+        bulk_writer.on_write_result(on_result)
+        bulk_writer.on_write_error(on_error)
         for uid in uid_list:
-            results[uid] = add_balance_to_user(uid, amount)
-        return results
-    except Exception as e:
-        print(f"Error bulk adding balance: {e}")
+            user_ref = get_db().collection(USERS_COLLECTION).document(uid)
+            bulk_writer.update(user_ref, {
+                'balance': firestore.Increment(amount),
+                'updated_at': firestore.SERVER_TIMESTAMP
+            })
+        bulk_writer.close()
+    except gexc.GoogleAPIError:
+        logger.exception("Error bulk adding balance")
+
+    _invalidate_user(*[uid for uid, success in results.items() if success])
+    return results
+
+def _fan_out(uid_list: list, func, *args) -> dict:
+    """Run func(uid, *args) for every uid concurrently and map uid -> result"""
+    if not uid_list:
         return {}
 
+    results = {}
+    with ThreadPoolExecutor(max_workers=min(MAX_BULK_WORKERS, len(uid_list))) as executor:
+        futures = {executor.submit(func, uid, *args): uid for uid in uid_list}
+        for future in as_completed(futures):
+            uid = futures[future]
+            try:
+                results[uid] = future.result()
+            except OperationError:
+                # e.g. insufficient balance; the other users are unaffected
+                results[uid] = False
+            except ValueError:
+                # @firestore.transactional gave up after repeated contention
+                logger.exception("Error in bulk operation for %s", uid)
+                results[uid] = False
+    return results
+
+def bulk_deduct_balance(uid_list: list, amount: float) -> dict:
+    """Deduct amount from multiple users, skipping those who can't afford it"""
+    # Each deduct needs its own balance check, so it can't go in one batch
+    return _fan_out(uid_list, deduct_user_balance, amount)
+
 # ================================================
 # DATA VERIFICATION
 # ================================================
@@ -374,19 +919,21 @@ def verify_order_data(order_id: str) -> dict:
 def delete_user(uid: str) -> bool:
     """Delete a user (dangerous - use with caution)"""
     try:
-        db.collection(USERS_COLLECTION).document(uid).delete()
+        get_db().collection(USERS_COLLECTION).document(uid).delete()
+        _invalidate_user(uid)
         return True
-    except Exception as e:
-        print(f"Error deleting user: {e}")
+    except gexc.GoogleAPIError:
+        logger.exception("Error deleting user")
         return False
 
 def delete_order(order_id: str) -> bool:
     """Delete an order (dangerous - use with caution)"""
     try:
-        db.collection(ORDERS_COLLECTION).document(order_id).delete()
+        get_db().collection(ORDERS_COLLECTION).document(order_id).delete()
+        _invalidate_orders()
         return True
-    except Exception as e:
-        print(f"Error deleting order: {e}")
+    except gexc.GoogleAPIError:
+        logger.exception("Error deleting order")
         return False
 
 # ================================================
@@ -397,11 +944,14 @@ def create_demo_user(email: str) -> str:
     """Create a demo user and return UID"""
     try:
         uid = email.split('@')[0] + '_demo'
-        create_user(uid, email)
+        try:
+            create_user(uid, email)
+        except AlreadyExistsError:
+            pass
         add_balance_to_user(uid, 500)
         return uid
-    except Exception as e:
-        print(f"Error creating demo user: {e}")
+    except gexc.GoogleAPIError:
+        logger.exception("Error creating demo user")
         return None
 
 def create_demo_order(uid: str) -> str:
@@ -421,6 +971,6 @@ def create_demo_order(uid: str) -> str:
             'status': 'pending'
         }
         return save_order(order_data)
-    except Exception as e:
-        print(f"Error creating demo order: {e}")
+    except gexc.GoogleAPIError:
+        logger.exception("Error creating demo order")
         return None
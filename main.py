@@ -6,43 +6,90 @@ SMM PANEL BACKEND - PRODUCTION READY
 - Render compatible (NO LOOP)
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from typing import Optional, List
+from datetime import datetime
+from contextlib import asynccontextmanager
 import os
-import json
-import firebase_admin
-from firebase_admin import credentials, firestore
+import anyio
+import orjson
+from google.api_core import exceptions as gexc
 
 # =========================
 # FIREBASE INIT (RENDER SAFE)
 # =========================
 
-if not firebase_admin._apps:
-    firebase_json = os.getenv("GOOGLE_APPLICATION_CREDENTIALS_JSON")
-    if not firebase_json:
-        raise RuntimeError("Firebase credentials missing")
-
-    cred = credentials.Certificate(json.loads(firebase_json))
-    firebase_admin.initialize_app(cred)
-
-db = firestore.client()
+# Reuse the client from firebase_admin_ops so the app has one gRPC channel;
+# it is created lazily and warmed up at startup
+import firebase_admin_ops as ops
 
 # =========================
 # FASTAPI INIT
 # =========================
 
-app = FastAPI(title="Infinity SMM Panel API", version="1.0")
+class FirestoreJSONResponse(JSONResponse):
+    """JSON response rendered with orjson that also handles Firestore timestamp subclasses"""
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, default=_json_default, option=orjson.OPT_NON_STR_KEYS)
+
+def _json_default(obj):
+    # Firestore returns DatetimeWithNanoseconds, a datetime subclass orjson won't take natively
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    raise TypeError
+
+# Handlers are plain `def`, so FastAPI runs them in a worker thread and the
+# blocking Firestore calls never stall the event loop. The default pool only
+# has 40 threads; raise it so more Firestore round-trips can overlap.
+WORKER_THREADS = int(os.getenv("WORKER_THREADS", "100"))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    anyio.to_thread.current_default_thread_limiter().total_tokens = WORKER_THREADS
+
+    # gRPC dials lazily; pay the connect/TLS cost before the first user request
+    await anyio.to_thread.run_sync(ops.warm_up)
+
+    # keep an in-memory copy of orders so listing/stats don't re-read the collection
+    await anyio.to_thread.run_sync(ops.start_orders_listener)
+
+    yield
+
+    await anyio.to_thread.run_sync(ops.stop_orders_listener)
+
+app = FastAPI(
+    title="Infinity SMM Panel API",
+    version="1.0",
+    default_response_class=FirestoreJSONResponse,
+    lifespan=lifespan,
+)
+
+# Comma-separated list of allowed origins, e.g. "https://panel.example.com".
+# Unset means no cross-origin access. An explicit "*" is honoured, but never
+# together with credentials, since Starlette would then echo any origin back.
+FRONTEND_ORIGINS = [
+    origin.strip()
+    for origin in os.getenv("FRONTEND_ORIGIN", "").split(",")
+    if origin.strip()
+]
 
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_origins=FRONTEND_ORIGINS,
+    allow_credentials="*" not in FRONTEND_ORIGINS,
+    allow_methods=["GET", "POST", "PUT"],
+    allow_headers=["Authorization", "Content-Type"],
+    max_age=86400,  # browsers cache preflight responses for a day
 )
 
+# compress large JSON responses (order/user lists)
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
 # =========================
 # MODELS
 # =========================
@@ -92,37 +139,36 @@ def health():
 
 @app.post("/api/users/create")
 def create_user(data: UserCreate):
-    ref = db.collection("users").document(data.uid)
-    if ref.get().exists:
+    try:
+        created = ops.create_user(data.uid, data.email)
+    except ops.AlreadyExistsError:
         return {"success": True, "message": "User exists"}
 
-    ref.set({
-        "uid": data.uid,
-        "email": data.email,
-        "username": None,
-        "balance": 0,
-        "created_at": firestore.SERVER_TIMESTAMP
-    })
+    if not created:
+        raise HTTPException(500, "Could not create user")
     return {"success": True}
 
 @app.get("/api/users/{uid}")
 def get_user(uid: str):
-    doc = db.collection("users").document(uid).get()
-    if not doc.exists:
+    try:
+        user = ops.get_user(uid)
+    except gexc.GoogleAPIError:
+        raise HTTPException(503, "Could not read user")
+    if user is None:
         raise HTTPException(404, "User not found")
-    return doc.to_dict()
+    return user
 
 @app.post("/api/users/username")
 def set_username(data: UsernameSet):
-    ref = db.collection("users").document(data.uid)
-    user = ref.get()
-    if not user.exists:
-        raise HTTPException(404, "User not found")
-
-    if user.to_dict().get("username"):
-        raise HTTPException(400, "Username already set")
-
-    ref.update({"username": data.username})
+    try:
+        updated = ops.set_user_username(data.uid, data.username)
+    except ops.NotFoundError as e:
+        raise HTTPException(404, str(e))
+    except ops.OperationError as e:
+        raise HTTPException(400, str(e))
+
+    if not updated:
+        raise HTTPException(500, "Could not set username")
     return {"success": True}
 
 # =========================
@@ -131,25 +177,13 @@ def set_username(data: UsernameSet):
 
 @app.post("/api/users/balance")
 def update_balance(data: BalanceUpdate):
-    ref = db.collection("users").document(data.uid)
-    user = ref.get()
-    if not user.exists:
-        raise HTTPException(404, "User not found")
-
-    bal = user.to_dict().get("balance", 0)
-
-    if data.action == "add":
-        bal += data.amount
-    elif data.action == "deduct":
-        if bal < data.amount:
-            raise HTTPException(400, "Insufficient balance")
-        bal -= data.amount
-    elif data.action == "set":
-        bal = data.amount
-    else:
-        raise HTTPException(400, "Invalid action")
-
-    ref.update({"balance": bal})
+    # read-check-write runs in a transaction so concurrent updates can't be lost
+    try:
+        bal = ops.apply_balance_action(data.uid, data.action, data.amount)
+    except ops.NotFoundError as e:
+        raise HTTPException(404, str(e))
+    except ops.OperationError as e:
+        raise HTTPException(400, str(e))
     return {"success": True, "balance": bal}
 
 # =========================
@@ -158,52 +192,66 @@ def update_balance(data: BalanceUpdate):
 
 @app.post("/api/orders")
 def create_order(data: OrderCreate):
-    user_ref = db.collection("users").document(data.uid)
-    user = user_ref.get()
-
-    if not user.exists:
-        raise HTTPException(404, "User not found")
-
-    balance = user.to_dict().get("balance", 0)
-    if balance < data.amount:
-        raise HTTPException(400, "Insufficient balance")
-
-    # deduct balance
-    user_ref.update({"balance": balance - data.amount})
-
-    order_ref = db.collection("orders").document()
-    order_ref.set({
-        "order_id": order_ref.id,
-        "uid": data.uid,
-        "username": data.username,
-        "service": data.service,
-        "platform": data.platform,
-        "plan": data.plan,
-        "amount": data.amount,
-        "quantity": data.quantity,
-        "target": data.target,
-        "utr": data.utr,
-        "status": "pending",
-        "created_at": firestore.SERVER_TIMESTAMP
-    })
-
-    return {"success": True, "order_id": order_ref.id}
+    # balance check, deduct and order insert commit together
+    try:
+        order_id = ops.place_order({
+            "uid": data.uid,
+            "username": data.username,
+            "service": data.service,
+            "platform": data.platform,
+            "plan": data.plan,
+            "amount": data.amount,
+            "quantity": data.quantity,
+            "target": data.target,
+            "utr": data.utr,
+            "status": "pending"
+        })
+    except ops.NotFoundError as e:
+        raise HTTPException(404, str(e))
+    except ops.OperationError as e:
+        raise HTTPException(400, str(e))
+
+    return {"success": True, "order_id": order_id}
+
+def _orders_response(orders: list, next_cursor: Optional[str]):
+    # returning the response directly skips jsonable_encoder on large lists
+    return FirestoreJSONResponse({"orders": orders, "next_cursor": next_cursor})
 
 @app.get("/api/orders/user/{uid}")
-def user_orders(uid: str):
-    orders = db.collection("orders").where("uid", "==", uid).stream()
-    return [o.to_dict() for o in orders]
+def user_orders(uid: str, limit: int = Query(50, ge=1, le=500), cursor: Optional[str] = None):
+    try:
+        orders, next_cursor = ops.get_user_orders(uid, limit=limit, cursor=cursor)
+    except ops.OperationError as e:
+        raise HTTPException(400, str(e))
+    return _orders_response(orders, next_cursor)
 
 @app.get("/api/orders")
-def all_orders():
-    orders = db.collection("orders").stream()
-    return [o.to_dict() for o in orders]
+def all_orders(status: Optional[str] = None, limit: int = Query(50, ge=1, le=500), cursor: Optional[str] = None):
+    # filtering and paging happen in Firestore, not in Python
+    try:
+        orders, next_cursor = ops.get_orders_page(status=status, limit=limit, cursor=cursor)
+    except ops.OperationError as e:
+        raise HTTPException(400, str(e))
+    return _orders_response(orders, next_cursor)
 
 @app.put("/api/orders/{order_id}")
 def update_order(order_id: str, data: OrderStatus):
-    ref = db.collection("orders").document(order_id)
-    if not ref.get().exists:
-        raise HTTPException(404, "Order not found")
+    try:
+        updated = ops.update_order_status(order_id, data.status)
+    except ops.NotFoundError as e:
+        raise HTTPException(404, str(e))
 
-    ref.update({"status": data.status})
+    if not updated:
+        raise HTTPException(500, "Could not update order")
     return {"success": True}
+
+# =========================
+# STATS
+# =========================
+
+@app.get("/api/stats")
+def stats():
+    try:
+        return ops.get_all_stats()
+    except gexc.GoogleAPIError:
+        raise HTTPException(503, "Could not read stats")